@@ -0,0 +1,31 @@
+"""
+Analysis agents. Each agent is imported on first access (PEP 562), so pulling
+in one agent doesn't load the heavy dependencies (faster-whisper, librosa,
+google-generativeai) of the others.
+"""
+import importlib
+
+# Public name -> submodule that defines it
+_LAZY_IMPORTS = {
+    "TranscriberAgent": ".transcriber",
+    "VoiceAnalyzerAgent": ".voice_analyzer",
+    "EmotionAnalyzerAgent": ".emotion_analyzer",
+    "ActionAgent": ".action_agent",
+    "BatchingActionAgent": ".action_agent",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        value = getattr(module, name)
+        # Cache on the package so later lookups skip __getattr__
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -2,9 +2,148 @@
 Action Agent - Generates actionable advice based on analysis results using Gemini.
 """
 import os
-import json
+import re
+import orjson
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import json_repair
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
 import google.generativeai as genai
-from typing import Dict, Any
+from google.api_core import exceptions as google_exceptions
+from typing import Dict, Any, List
+
+
+# Identical prompts (retries, page reloads, re-analysis) reuse the cached advice
+CACHE_TTL_SECONDS = 3600
+CACHE_MAX_ENTRIES = 1024
+
+# Gemini models tried in order; later ones serve requests only when the
+# earlier ones fail
+ADVICE_MODELS = [
+    name.strip()
+    for name in os.getenv("ADVICE_MODELS", "gemini-2.5-flash,gemini-2.0-flash").split(",")
+    if name.strip()
+]
+
+# A model that fails this many calls in a row is skipped for the cooldown, so
+# an outage costs one fast failover instead of a timeout per request
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_COOLDOWN_SECONDS = 60
+
+# Errors worth retrying on the same model (rate limiting, brief unavailability)
+TRANSIENT_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable)
+
+# Body of a response wrapped in a markdown code fence (```json, ```JSON or bare
+# ```); a missing closing fence (truncated output) runs to the end. Anchored to
+# the whole response so fenced blocks inside JSON string values are left alone
+_FENCE_RE = re.compile(r'```(?:json)?\s*(.*?)\s*(?:```)?', re.S | re.I)
+
+# Scores assumed for any voice metric missing from the analysis
+DEFAULT_VOICE_SCORES = {"pitch": 5, "volume": 5, "speed": 5, "prosody": 5}
+
+# Breakdown fields, and the placeholders shown when the breakdown can't be generated
+BREAKDOWN_FIELDS = ("emotional_range", "gesture_effectiveness", "facial_expressions", "overall_impact")
+DEFAULT_BREAKDOWN = {
+    "emotional_range": "Your emotional expression analysis is being processed.",
+    "gesture_effectiveness": "Your gesture analysis is being processed.",
+    "facial_expressions": "Your facial expression analysis is being processed.",
+    "overall_impact": "Your overall impact analysis is being processed."
+}
+
+BATCH_PROMPT_HEADER = """You will receive {count} independent requests separated by lines of "---".
+Answer each one exactly as if it had been sent on its own.
+Respond ONLY with a valid JSON array of {count} strings (no markdown, no extra text), where element i is the complete answer to ITEM i+1.
+
+"""
+
+# Prompt templates. The fixed instructions come first and the per-speech data
+# last, so every request for an agent type shares a byte-identical prefix that
+# Gemini's implicit context caching can reuse.
+TRANSCRIBER_PROMPT = """You are an expert speech coach. A speaker gave the speech below.
+
+Please provide:
+1. A rewritten version of their speech that improves clarity, structure, and argumentation while maintaining their core message and intent.
+2. 2-3 specific tips on what was changed and why.
+
+Make the rewrite natural and conversational, not overly formal unless the context demands it.
+
+SPEECH CONTEXT: {context}
+
+QUALITY SCORE: {quality_score}/10
+
+ORIGINAL SPEECH:
+{original_text}"""
+
+VOICE_PROMPT = """You are an expert voice coach. A speaker's voice has been analyzed with the scores below (0-10 scale).
+
+Based on these scores, provide:
+1. Identification of the 1-2 weakest areas
+2. 3-4 specific vocal exercises to improve those areas
+3. Practical tips they can apply immediately in their next speech
+
+Be specific and actionable. Focus on exercises they can do daily.
+
+- Pitch Variation: {pitch}/10
+- Volume Consistency: {volume}/10
+- Speech Speed: {speed}/10
+- Prosody (Intonation): {prosody}/10"""
+
+EMOTION_COMBINED_PROMPT = """You are an expert in nonverbal communication and facial expressions for public speaking.
+
+You will be given the pattern of a speaker's facial emotions throughout their speech and their ratings.
+
+Respond ONLY with valid JSON in this exact format:
+{{
+  "advice": "Coaching advice (markdown allowed) covering: 1. Assessment of their emotional expression (what's working, what needs work) 2. 3-4 specific exercises to improve facial expressions and eye contact 3. Tips for projecting appropriate emotions during speeches 4. Advice on maintaining engagement through facial cues",
+  "breakdown": {{
+    "emotional_range": "2-3 sentence analysis of their emotional variety and transitions",
+    "gesture_effectiveness": "2-3 sentence analysis of their hand gestures and body language",
+    "facial_expressions": "2-3 sentence analysis of their facial expressions and eye contact",
+    "overall_impact": "2-3 sentence overall assessment of their nonverbal communication impact"
+  }}
+}}
+
+Be specific, practical and constructive. Include exercises they can practice in front of a mirror.
+
+Emotion pattern: {emotion_summary}
+
+Overall Emotional Expression Rating: {overall_rating}/10
+Gesture and Body Language Rating: {gesture_rating}/10"""
+
+EMOTION_ADVICE_PROMPT = """You are an expert in nonverbal communication and facial expressions for public speaking.
+
+You will be given the pattern of a speaker's facial emotions throughout their speech and their ratings. Based on this analysis, provide:
+1. Assessment of their emotional expression (what's working, what needs work)
+2. 3-4 specific exercises to improve facial expressions and eye contact
+3. Tips for projecting appropriate emotions during speeches
+4. Advice on maintaining engagement through facial cues
+
+Be specific and practical. Include exercises they can practice in front of a mirror.
+
+Emotion pattern: {emotion_summary}
+
+Overall Emotional Expression Rating: {overall_rating}/10
+Gesture and Body Language Rating: {gesture_rating}/10"""
+
+EMOTION_BREAKDOWN_PROMPT = """You are an expert in nonverbal communication for public speaking.
+
+Analyze the speaker's performance below. Provide 4 brief analyses (2-3 sentences each) in this EXACT JSON format:
+{{
+  "emotional_range": "Analysis of their emotional variety and transitions",
+  "gesture_effectiveness": "Analysis of their hand gestures and body language",
+  "facial_expressions": "Analysis of their facial expressions and eye contact",
+  "overall_impact": "Overall assessment of their nonverbal communication impact"
+}}
+
+Be specific, constructive, and professional. Focus on what they did well and areas for improvement.
+
+- Overall Emotional Expression: {overall_rating}/10
+- Gesture/Body Language: {gesture_rating}/10
+- Emotion patterns: {emotion_counts}"""
 
 
 class ActionAgent:
@@ -15,9 +154,17 @@ class ActionAgent:
     - Emotion: Facial/eye exercises
     """
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, request_timeout: float = 30.0, max_retries: int = 2,
+                 model_names: List[str] = None, hedge: bool = False):
         """
         Initialize Gemini API for generating advice.
+        Args:
+            request_timeout: Seconds to wait for a single Gemini call before moving
+                to the next model
+            max_retries: Extra attempts on the same model after a transient error
+            model_names: Fallback chain of Gemini models (defaults to ADVICE_MODELS)
+            hedge: Query the first two models at once and use whichever answers
+                first, trading extra API calls for lower tail latency
         """
         if api_key is None:
             api_key = os.getenv("GEMINI_API_KEY")
@@ -25,8 +172,33 @@ class ActionAgent:
         if not api_key:
             raise ValueError("GEMINI_API_KEY not provided")
         
+        model_names = model_names or ADVICE_MODELS
+        if not model_names:
+            raise ValueError("No Gemini models configured (check ADVICE_MODELS)")
+        
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.models = [(name, genai.GenerativeModel(name)) for name in model_names]
+        
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        
+        # LRU of prompt hash -> (timestamp, response text)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # Prompt hash -> Future for Gemini calls currently in progress
+        self._inflight = {}
+        
+        # Circuit breaker per model: consecutive failures and when it may be retried
+        self._failures = {name: 0 for name, _ in self.models}
+        self._open_until = {name: 0.0 for name, _ in self.models}
+        self._breaker_lock = threading.Lock()
+        
+        # Hedged calls run _call_model concurrently on their own pool
+        self.hedge = hedge
+        self._hedge_executor = ThreadPoolExecutor(max_workers=8) if hedge else None
     
     def generate_advice(self, agent_type: str, analysis_data: Dict, context: str = "") -> Dict:
         """
@@ -49,6 +221,159 @@ class ActionAgent:
         else:
             return {"advice": "Unknown agent type"}
     
+    async def generate_advice_async(self, agent_type: str, analysis_data: Dict, context: str = "") -> Dict:
+        """
+        Async variant of generate_advice for event-loop callers: the blocking
+        Gemini calls run in a worker thread so the loop keeps serving requests.
+        """
+        return await asyncio.to_thread(self.generate_advice, agent_type, analysis_data, context)
+    
+    def _generate_text(self, prompt: str) -> str:
+        """
+        Get Gemini's response text for a prompt, served from the cache when the
+        same prompt was answered within CACHE_TTL_SECONDS. Concurrent calls with
+        the same prompt (retries, double clicks) share one Gemini request.
+        """
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and now - entry[0] < CACHE_TTL_SECONDS:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                print(f"Advice cache hit ({self.cache_hits} hits / {self.cache_misses} misses)")
+                return entry[1]
+            
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                self.cache_misses += 1
+                pending = self._inflight[key] = Future()
+        
+        if not owner:
+            print("Identical advice prompt already in flight, sharing its result")
+            return pending.result()
+        
+        try:
+            text = self._generate_with_timeout(prompt)
+        except Exception as e:
+            with self._cache_lock:
+                del self._inflight[key]
+            pending.set_exception(e)
+            raise
+        
+        with self._cache_lock:
+            self._cache[key] = (now, text)
+            self._cache.move_to_end(key)
+            while len(self._cache) > CACHE_MAX_ENTRIES:
+                self._cache.popitem(last=False)
+            del self._inflight[key]
+        
+        pending.set_result(text)
+        
+        return text
+    
+    def _generate_with_timeout(self, prompt: str) -> str:
+        """
+        Get a response from the first model in the fallback chain that answers,
+        skipping models whose circuit breaker is open.
+        """
+        last_error = None
+        models = self._available_models()
+        
+        if self.hedge and len(models) > 1:
+            try:
+                return self._generate_hedged(prompt, models[:2])
+            except Exception as e:
+                last_error = e
+                models = models[2:]
+        
+        for name, model in models:
+            try:
+                text = self._call_model(model, prompt)
+            except Exception as e:
+                print(f"Gemini model {name} failed: {e}")
+                self._record_failure(name)
+                last_error = e
+                continue
+            
+            self._record_success(name)
+            return text
+        
+        raise last_error
+    
+    def _generate_hedged(self, prompt: str, models: list) -> str:
+        """
+        Send the prompt to several models at once and return the first answer.
+        The slower call is left to finish in the background.
+        """
+        futures = {
+            self._hedge_executor.submit(self._call_model, model, prompt): name
+            for name, model in models
+        }
+        last_error = None
+        
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                text = future.result()
+            except Exception as e:
+                print(f"Gemini model {name} failed: {e}")
+                self._record_failure(name)
+                last_error = e
+                continue
+            
+            self._record_success(name)
+            return text
+        
+        raise last_error
+    
+    def _call_model(self, model, prompt: str) -> str:
+        """
+        Call one Gemini model with a per-attempt timeout, enforced by the SDK.
+        Rate-limit and unavailable errors are retried with jittered exponential
+        backoff; anything else (including a timeout) is raised straight away so
+        the next model in the chain is tried instead of the same stalled endpoint.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = model.generate_content(
+                    prompt, request_options={"timeout": self.request_timeout}
+                )
+                return response.text.strip()
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                # Full jitter keeps concurrent requests from retrying in lockstep
+                delay = random.uniform(0, min(2.0, 0.3 * 2 ** attempt))
+                print(f"Gemini call failed ({e}), retrying in {delay:.2f}s ({attempt + 1}/{self.max_retries})...")
+                time.sleep(delay)
+    
+    def _available_models(self) -> list:
+        """
+        Models in chain order whose breaker is closed (or whose cooldown has
+        passed). If every breaker is open, the whole chain is tried anyway.
+        """
+        now = time.monotonic()
+        with self._breaker_lock:
+            available = [(name, model) for name, model in self.models if self._open_until[name] <= now]
+        
+        return available or self.models
+    
+    def _record_failure(self, name: str):
+        with self._breaker_lock:
+            self._failures[name] += 1
+            if self._failures[name] >= BREAKER_FAILURE_THRESHOLD:
+                self._open_until[name] = time.monotonic() + BREAKER_COOLDOWN_SECONDS
+                print(f"Gemini model {name} failed {self._failures[name]} times in a row, "
+                      f"skipping it for {BREAKER_COOLDOWN_SECONDS}s")
+    
+    def _record_success(self, name: str):
+        with self._breaker_lock:
+            self._failures[name] = 0
+            self._open_until[name] = 0.0
+    
     def _generate_transcriber_advice(self, analysis_data: Dict, context: str) -> Dict:
         """
         Generate improved speech rewrite based on transcription.
@@ -57,24 +382,14 @@ class ActionAgent:
         original_text = transcription.get('text', '')
         quality_score = transcription.get('quality_score', 0)
         
-        prompt = f"""You are an expert speech coach. A speaker gave the following speech:
-
-ORIGINAL SPEECH:
-{original_text}
-
-QUALITY SCORE: {quality_score}/10
-
-SPEECH CONTEXT: {context if context else "General public speaking"}
-
-Please provide:
-1. A rewritten version of their speech that improves clarity, structure, and argumentation while maintaining their core message and intent.
-2. 2-3 specific tips on what was changed and why.
-
-Make the rewrite natural and conversational, not overly formal unless the context demands it."""
-
+        prompt = TRANSCRIBER_PROMPT.format(
+            context=context if context else "General public speaking",
+            quality_score=quality_score,
+            original_text=original_text
+        )
+        
         try:
-            response = self.model.generate_content(prompt)
-            advice = response.text.strip()
+            advice = self._generate_text(prompt)
             
             return {"advice": advice}
         except Exception as e:
@@ -85,28 +400,12 @@ Make the rewrite natural and conversational, not overly formal unless the contex
         Generate vocal exercises based on voice analysis.
         """
         voice = analysis_data.get('voice', {})
-        pitch = voice.get('pitch', 5)
-        volume = voice.get('volume', 5)
-        speed = voice.get('speed', 5)
-        prosody = voice.get('prosody', 5)
         
-        prompt = f"""You are an expert voice coach. A speaker's voice has been analyzed with these scores (0-10 scale):
-
-- Pitch Variation: {pitch}/10
-- Volume Consistency: {volume}/10
-- Speech Speed: {speed}/10
-- Prosody (Intonation): {prosody}/10
-
-Based on these scores, provide:
-1. Identification of the 1-2 weakest areas
-2. 3-4 specific vocal exercises to improve those areas
-3. Practical tips they can apply immediately in their next speech
-
-Be specific and actionable. Focus on exercises they can do daily."""
-
+        # Missing scores fall back to the neutral default
+        prompt = VOICE_PROMPT.format_map({**DEFAULT_VOICE_SCORES, **voice})
+        
         try:
-            response = self.model.generate_content(prompt)
-            advice = response.text.strip()
+            advice = self._generate_text(prompt)
             
             return {"advice": advice}
         except Exception as e:
@@ -115,6 +414,9 @@ Be specific and actionable. Focus on exercises they can do daily."""
     def _generate_emotion_advice(self, analysis_data: Dict) -> Dict:
         """
         Generate facial expression exercises and breakdown based on emotion analysis.
+        Advice and breakdown come from one Gemini call; if its JSON can't be
+        parsed, falls back to requesting them separately. If the call itself
+        fails, returns the error advice without re-requesting.
         """
         emotions = analysis_data.get('emotions', {})
         timeline = emotions.get('timeline', [])
@@ -128,26 +430,46 @@ Be specific and actionable. Focus on exercises they can do daily."""
         else:
             emotion_summary = "No emotion data available"
         
+        combined_prompt = EMOTION_COMBINED_PROMPT.format(
+            emotion_summary=emotion_summary,
+            overall_rating=overall_rating,
+            gesture_rating=gesture_rating
+        )
+        
+        try:
+            response_text = self._generate_text(combined_prompt)
+        except Exception as e:
+            # Gemini itself failed (timeout, rate limit, outage); more calls won't help
+            return {"advice": f"Error generating advice: {str(e)}", "breakdown": {}}
+        
+        try:
+            data = self._parse_json_response(response_text)
+            
+            return {
+                "advice": str(data["advice"]).strip(),
+                "breakdown": self._normalize_breakdown(data.get("breakdown", {}))
+            }
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Combined emotion advice unparseable, requesting separately: {e}")
+            return self._generate_emotion_advice_separately(analysis_data, emotion_summary)
+    
+    def _generate_emotion_advice_separately(self, analysis_data: Dict, emotion_summary: str) -> Dict:
+        """
+        Two-call fallback: free-text advice, then the JSON breakdown.
+        """
+        emotions = analysis_data.get('emotions', {})
+        overall_rating = emotions.get('overall_rating', 5)
+        gesture_rating = emotions.get('gesture_rating', 5)
+        
         # Generate actionable advice
-        advice_prompt = f"""You are an expert in nonverbal communication and facial expressions for public speaking.
-
-A speaker's facial emotions throughout their speech showed this pattern:
-{emotion_summary}
-
-Overall Emotional Expression Rating: {overall_rating}/10
-Gesture and Body Language Rating: {gesture_rating}/10
-
-Based on this analysis, provide:
-1. Assessment of their emotional expression (what's working, what needs work)
-2. 3-4 specific exercises to improve facial expressions and eye contact
-3. Tips for projecting appropriate emotions during speeches
-4. Advice on maintaining engagement through facial cues
-
-Be specific and practical. Include exercises they can practice in front of a mirror."""
-
+        advice_prompt = EMOTION_ADVICE_PROMPT.format(
+            emotion_summary=emotion_summary,
+            overall_rating=overall_rating,
+            gesture_rating=gesture_rating
+        )
+        
         try:
-            response = self.model.generate_content(advice_prompt)
-            advice = response.text.strip()
+            advice = self._generate_text(advice_prompt)
             
             # Generate breakdown analysis
             breakdown = self._generate_emotion_breakdown(analysis_data)
@@ -177,48 +499,208 @@ Be specific and practical. Include exercises they can practice in front of a mir
         else:
             emotion_counts = {}
         
-        breakdown_prompt = f"""You are an expert in nonverbal communication for public speaking.
-
-Analyze this speaker's performance:
-- Overall Emotional Expression: {overall_rating}/10
-- Gesture/Body Language: {gesture_rating}/10
-- Emotion patterns: {emotion_counts}
-
-Provide 4 brief analyses (2-3 sentences each) in this EXACT JSON format:
-{{
-  "emotional_range": "Analysis of their emotional variety and transitions",
-  "gesture_effectiveness": "Analysis of their hand gestures and body language",
-  "facial_expressions": "Analysis of their facial expressions and eye contact",
-  "overall_impact": "Overall assessment of their nonverbal communication impact"
-}}
+        breakdown_prompt = EMOTION_BREAKDOWN_PROMPT.format(
+            overall_rating=overall_rating,
+            gesture_rating=gesture_rating,
+            emotion_counts=emotion_counts
+        )
+        
+        try:
+            breakdown = self._parse_json_response(self._generate_text(breakdown_prompt))
+            
+            return self._normalize_breakdown(breakdown)
+        except Exception as e:
+            print(f"Error generating breakdown: {e}")
+            return dict(DEFAULT_BREAKDOWN)
+    
+    def _strip_code_fence(self, response_text: str) -> str:
+        """
+        Remove the markdown code fence wrapping the response, if present.
+        """
+        match = _FENCE_RE.fullmatch(response_text.strip())
+        
+        return match.group(1) if match else response_text
+    
+    def _parse_json_response(self, response_text: str) -> Any:
+        """
+        Parse a JSON answer from Gemini. Malformed output (trailing commas,
+        single quotes, truncated objects) is repaired instead of costing
+        another round trip.
+        """
+        try:
+            return orjson.loads(response_text)
+        except ValueError:
+            pass
+        
+        response_text = self._strip_code_fence(response_text)
+        
+        try:
+            return orjson.loads(response_text)
+        except ValueError:
+            data = json_repair.loads(response_text)
+            if data in ("", None):
+                raise ValueError(f"Response is not JSON: {response_text!r:.80}")
+            print("Repaired malformed JSON from Gemini")
+            return data
+    
+    def _normalize_breakdown(self, breakdown: Dict) -> Dict:
+        """
+        Keep only the expected breakdown fields, filling any that are missing.
+        """
+        return {field: breakdown.get(field, "Analysis not available") for field in BREAKDOWN_FIELDS}
 
-Be specific, constructive, and professional. Focus on what they did well and areas for improvement."""
 
+class BatchingActionAgent(ActionAgent):
+    """
+    ActionAgent that coalesces concurrent advice requests into shared Gemini calls.
+    Prompts arriving within max_wait seconds of each other (up to max_batch_size)
+    are sent as one request and each caller receives its own answer.
+    """
+    
+    def __init__(self, api_key: str = None, max_batch_size: int = 5, max_wait: float = 0.05, **kwargs):
+        super().__init__(api_key=api_key, **kwargs)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # Worst case a caller waits for: the batched call (double timeout) and then
+        # its individual retry, each through every model with retries and backoff
+        attempts = (self.max_retries + 1) * len(self.models)
+        self.result_timeout = 3 * attempts * (self.request_timeout + 2.0) + max_wait
+        self._loop = None
+        self._queue = None
+        self._worker = None
+    
+    async def generate_advice_async(self, agent_type: str, analysis_data: Dict, context: str = "") -> Dict:
+        """
+        Like ActionAgent.generate_advice_async, but Gemini calls made while
+        building this advice are batched with those of concurrent requests.
+        """
+        if self._worker is None:
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            self._worker = self._loop.create_task(self._run_batches())
+        
+        return await super().generate_advice_async(agent_type, analysis_data, context)
+    
+    def _generate_with_timeout(self, prompt: str) -> str:
+        """
+        Called from a worker thread: hand the prompt to the batching loop and wait.
+        Before the batching loop has started (e.g. sync generate_advice), calls
+        Gemini directly.
+        """
+        if self._loop is None:
+            return super()._generate_with_timeout(prompt)
+        
+        future = asyncio.run_coroutine_threadsafe(self._enqueue(prompt), self._loop)
         try:
-            response = self.model.generate_content(breakdown_prompt)
-            response_text = response.text.strip()
+            return future.result(timeout=self.result_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Batched Gemini request did not finish within {self.result_timeout:.0f}s")
+    
+    async def _enqueue(self, prompt: str) -> str:
+        future = self._loop.create_future()
+        await self._queue.put((prompt, future))
+        return await future
+    
+    async def _run_batches(self):
+        """
+        Drain the queue into batches of up to max_batch_size, waiting at most
+        max_wait seconds after the first prompt for others to join.
+        """
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            self._loop.create_task(self._dispatch(batch))
+    
+    async def _dispatch(self, batch: list):
+        """
+        Send a batch to Gemini and resolve each caller's future with its answer.
+        Falls back to one call per prompt if the batched response can't be split.
+        Callers that already gave up (cancelled futures) are skipped.
+        """
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+        
+        if len(batch) == 1:
+            prompt, future = batch[0]
+            try:
+                text = await self._generate_async(prompt, self.request_timeout)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                return
             
-            # Remove markdown code blocks if present
-            if response_text.startswith("```"):
-                response_text = response_text.split("```")[1]
-                if response_text.startswith("json"):
-                    response_text = response_text[4:].strip()
+            if not future.done():
+                future.set_result(text)
+            return
+        
+        batch_prompt = BATCH_PROMPT_HEADER.format(count=len(batch)) + "\n---\n".join(
+            f"ITEM {i}:\n{prompt}" for i, (prompt, _) in enumerate(batch, start=1)
+        )
+        
+        try:
+            response_text = await self._generate_async(batch_prompt, self.request_timeout * 2)
+            answers = orjson.loads(self._strip_code_fence(response_text))
             
-            breakdown = json.loads(response_text)
+            if not isinstance(answers, list) or len(answers) != len(batch):
+                raise ValueError(f"expected {len(batch)} answers, got {answers!r:.80}")
             
-            return {
-                "emotional_range": breakdown.get("emotional_range", "Analysis not available"),
-                "gesture_effectiveness": breakdown.get("gesture_effectiveness", "Analysis not available"),
-                "facial_expressions": breakdown.get("facial_expressions", "Analysis not available"),
-                "overall_impact": breakdown.get("overall_impact", "Analysis not available")
-            }
+            for (_, future), answer in zip(batch, answers):
+                if not future.done():
+                    future.set_result(answer.strip() if isinstance(answer, str) else orjson.dumps(answer).decode())
         except Exception as e:
-            print(f"Error generating breakdown: {e}")
-            return {
-                "emotional_range": "Your emotional expression analysis is being processed.",
-                "gesture_effectiveness": "Your gesture analysis is being processed.",
-                "facial_expressions": "Your facial expression analysis is being processed.",
-                "overall_impact": "Your overall impact analysis is being processed."
-            }
-
-
+            print(f"Batched advice request failed, sending {len(batch)} prompts individually: {e}")
+            await asyncio.gather(*(self._dispatch([item]) for item in batch if not item[1].done()))
+    
+    async def _generate_async(self, prompt: str, timeout: float) -> str:
+        """
+        Async counterpart of _generate_with_timeout: walk the fallback chain,
+        skipping models whose circuit breaker is open.
+        """
+        last_error = None
+        
+        for name, model in self._available_models():
+            try:
+                text = await self._call_model_async(model, prompt, timeout)
+            except Exception as e:
+                print(f"Gemini model {name} failed: {e}")
+                self._record_failure(name)
+                last_error = e
+                continue
+            
+            self._record_success(name)
+            return text
+        
+        raise last_error
+    
+    async def _call_model_async(self, model, prompt: str, timeout: float) -> str:
+        """
+        Async counterpart of _call_model: same per-attempt timeout and jittered
+        retry on rate-limit and unavailable errors.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await asyncio.wait_for(
+                    model.generate_content_async(prompt, request_options={"timeout": timeout}),
+                    timeout
+                )
+                return response.text.strip()
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Gemini did not respond within {timeout}s")
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = random.uniform(0, min(2.0, 0.3 * 2 ** attempt))
+                print(f"Gemini call failed ({e}), retrying in {delay:.2f}s ({attempt + 1}/{self.max_retries})...")
+                await asyncio.sleep(delay)
@@ -1,12 +1,101 @@
 """
 Emotion Analyzer Agent - Uses Gemini Vision API for facial emotion detection.
 """
+import io
 import os
+import re
+import time
+import random
+import hashlib
+import orjson
+import diskcache
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import numpy as np
-from typing import List, Dict
-import json
+from collections import Counter
+from typing import List, Dict, Union
+
+
+# Gemini requests in flight at once (shared by all videos on this agent)
+MAX_CONCURRENT_REQUESTS = 8
+
+# Attempts per frame when Gemini answers 429 (backoff 1s, 2s, 4s, ...)
+MAX_RATE_LIMIT_ATTEMPTS = 5
+
+# Outermost JSON object in a response, with or without a markdown fence around it
+_JSON_RE = re.compile(r'\{.*\}', re.S)
+
+# Frames are sent as JPEG no larger than this on their longest side
+MAX_IMAGE_SIZE = 512
+JPEG_QUALITY = 85
+
+# Frames packed into a single multi-image Gemini request
+FRAMES_PER_REQUEST = 8
+
+# A frame whose 64-bit dHash is within this many bits of the last analyzed
+# frame reuses that frame's result instead of being sent to Gemini
+DUPLICATE_HASH_DISTANCE = 5
+
+EMOTIONS = ["Happy", "Angry", "Disgust", "Fear", "Surprise", "Sad", "Neutral"]
+POSITIVE_EMOTIONS = ('Happy', 'Surprise')
+NEGATIVE_EMOTIONS = ('Angry', 'Disgust', 'Fear', 'Sad')
+
+# Result used for a frame that couldn't be analyzed
+NEUTRAL_EMOTIONS = {**{emotion: 0 for emotion in EMOTIONS}, "Neutral": 100, "dominant": "Neutral"}
+
+FRAME_PROMPT = """Analyze the facial expression and body language in this image.
+Respond ONLY with valid JSON in this exact format (no markdown, no extra text):
+{
+  "Happy": 0,
+  "Angry": 0,
+  "Disgust": 0,
+  "Fear": 0,
+  "Surprise": 0,
+  "Sad": 0,
+  "Neutral": 0,
+  "gesture_score": 7.5
+}
+
+Emotion values should sum to approximately 100. The gesture_score (0-10) rates body language, hand gestures, and posture quality for public speaking."""
+
+BATCH_PROMPT = """You will receive {count} images: frames from the same speech, in chronological order.
+Analyze the facial expression and body language in EACH image independently.
+Respond ONLY with valid JSON in this exact format (no markdown, no extra text), with exactly {count} entries in image order:
+{{
+  "results": [
+    {{"Happy": 0, "Angry": 0, "Disgust": 0, "Fear": 0, "Surprise": 0, "Sad": 0, "Neutral": 0, "gesture_score": 7.5}}
+  ]
+}}
+
+Emotion values for each image should sum to approximately 100. The gesture_score (0-10) rates body language, hand gestures, and posture quality for public speaking."""
+
+# Part of every cache key, so editing a prompt invalidates earlier results
+PROMPT_VERSION = hashlib.blake2b(
+    (FRAME_PROMPT + BATCH_PROMPT).encode("utf-8"), digest_size=8
+).hexdigest()
+
+
+# (minimum rating, description), checked from the highest threshold down
+GESTURE_DESCRIPTIONS = (
+    (9.0, "Exceptional and highly engaging"),
+    (8.0, "Very effective and natural"),
+    (7.0, "Natural and purposeful"),
+    (6.0, "Generally appropriate"),
+    (5.0, "Adequate with room for improvement"),
+)
+
+
+def _to_score(value, default: float = 0.0) -> float:
+    """
+    Coerce a score from Gemini (or an older cache entry) to a float, falling
+    back to default for missing or non-numeric values.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
 
 
 class EmotionAnalyzerAgent:
@@ -15,9 +104,13 @@ class EmotionAnalyzerAgent:
     Tracks: Happy, Angry, Disgust, Fear, Surprise, Sad, Neutral
     """
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+                 keyframe_stride: int = 1):
         """
         Initialize Gemini API.
+        Args:
+            max_concurrency: Maximum number of frames sent to Gemini at once
+            keyframe_stride: Analyze every k-th frame and interpolate the ones in between
         """
         if api_key is None:
             api_key = os.getenv("GEMINI_API_KEY")
@@ -26,14 +119,24 @@ class EmotionAnalyzerAgent:
             raise ValueError("GEMINI_API_KEY not provided")
         
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        # JSON mode stops the model from wrapping answers in markdown
+        self.model = genai.GenerativeModel(
+            'gemini-2.5-flash',
+            generation_config={"response_mime_type": "application/json"}
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.keyframe_stride = max(1, keyframe_stride)
+        
+        # Per-frame results persisted across runs and restarts
+        self._cache = diskcache.Cache(os.getenv("GEMINI_CACHE_DIR", ".gemini_cache"))
     
     def analyze(self, frames: List[tuple]) -> Dict:
         """
         Analyze emotions and gestures from video frames.
         
         Args:
-            frames: List of (timestamp_str, frame_image) tuples
+            frames: List of (timestamp_str, frame) tuples; frame is an RGB
+                array or JPEG bytes
         
         Returns:
             {
@@ -59,9 +162,16 @@ class EmotionAnalyzerAgent:
         timeline = []
         gesture_scores = []
         
-        for timestamp, frame in frames:
-            emotion_data, gesture_score = self._analyze_frame(frame, timestamp)
-            timeline.append(emotion_data)
+        # Only keyframes (plus the last frame, so every gap is bounded) go to Gemini
+        keyframes = list(range(0, len(frames), self.keyframe_stride))
+        if frames and keyframes[-1] != len(frames) - 1:
+            keyframes.append(len(frames) - 1)
+        
+        key_results = self._analyze_frames([frames[i] for i in keyframes])
+        results = self._interpolate_results(keyframes, key_results, len(frames))
+        
+        for (timestamp, _), (emotion_data, gesture_score) in zip(frames, results):
+            timeline.append({**emotion_data, "time": timestamp})
             gesture_scores.append(gesture_score)
         
         # Calculate overall rating
@@ -78,77 +188,226 @@ class EmotionAnalyzerAgent:
             "gesture_description": gesture_description
         }
     
-    def _analyze_frame(self, frame: np.ndarray, timestamp: str) -> tuple:
+    def _analyze_frames(self, frames: List[tuple]) -> List[tuple]:
         """
-        Analyze emotions and gestures in a single frame using Gemini Vision.
-        Returns: (emotion_dict, gesture_score)
+        Analyze frames with Gemini, skipping near-duplicates and cached frames.
+        Returns: [(emotion_dict, gesture_score), ...] in frame order
         """
-        # Convert numpy array to PIL Image
+        # Consecutive near-identical frames (a speaker holding still) reuse
+        # the last analyzed frame's result
+        unique_frames = []
+        source_index = []
+        last_hash = None
+        
+        for timestamp, frame in frames:
+            frame_hash = self._dhash(frame)
+            if last_hash is None or bin(frame_hash ^ last_hash).count("1") > DUPLICATE_HASH_DISTANCE:
+                unique_frames.append((timestamp, frame))
+                last_hash = frame_hash
+            source_index.append(len(unique_frames) - 1)
+        
+        # Encode each distinct frame once; frames analyzed before (same JPEG
+        # bytes, same prompts) come from the on-disk cache
+        unique_results = [None] * len(unique_frames)
+        pending = []
+        
+        for i, (timestamp, frame) in enumerate(unique_frames):
+            image_part = self._to_image_part(frame)
+            cache_key = self._cache_key(image_part)
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                unique_results[i] = cached
+            else:
+                pending.append((i, timestamp, image_part, cache_key))
+        
+        # Pack the rest into multi-image requests and overlap those round trips
+        batches = [
+            pending[i:i + FRAMES_PER_REQUEST]
+            for i in range(0, len(pending), FRAMES_PER_REQUEST)
+        ]
+        
+        for batch, batch_results in zip(batches, self._executor.map(self._analyze_batch, batches)):
+            for (i, _, _, _), result in zip(batch, batch_results):
+                unique_results[i] = result
+        
+        return [unique_results[index] for index in source_index]
+    
+    def _interpolate_results(self, keyframes: List[int], key_results: List[tuple], count: int) -> List[tuple]:
+        """
+        Fill the frames between keyframes by linearly interpolating emotion
+        scores and gesture score from the surrounding keyframes.
+        """
+        results = dict(zip(keyframes, key_results))
+        
+        for start, end in zip(keyframes, keyframes[1:]):
+            left, left_gesture = results[start]
+            right, right_gesture = results[end]
+            left_gesture = _to_score(left_gesture, 5.0)
+            right_gesture = _to_score(right_gesture, 5.0)
+            
+            for i in range(start + 1, end):
+                weight = (i - start) / (end - start)
+                emotions = {}
+                for emotion in EMOTIONS:
+                    left_score = _to_score(left.get(emotion, 0))
+                    right_score = _to_score(right.get(emotion, 0))
+                    emotions[emotion] = round(left_score + (right_score - left_score) * weight, 1)
+                
+                emotions["dominant"] = max(emotions, key=emotions.get)
+                results[i] = (emotions, left_gesture + (right_gesture - left_gesture) * weight)
+        
+        return [results[i] for i in range(count)]
+    
+    def _dhash(self, frame: Union[np.ndarray, bytes]) -> int:
+        """
+        64-bit difference hash of a frame: sign of horizontal gradients on a
+        9x8 grayscale thumbnail. Similar-looking frames have nearby hashes.
+        """
+        if isinstance(frame, bytes):
+            image = Image.open(io.BytesIO(frame))
+            # Let the JPEG decoder downscale (up to 8x) instead of decoding full size
+            image.draft("L", (9 * 8, 8 * 8))
+        else:
+            image = Image.fromarray(frame)
+        
+        small = np.asarray(image.convert("L").resize((9, 8)), dtype=np.int16)
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+        
+        return int.from_bytes(np.packbits(bits).tobytes(), "big")
+    
+    def _to_image_part(self, frame: Union[np.ndarray, bytes]) -> Dict:
+        """
+        Encode a frame for upload: downscaled to MAX_IMAGE_SIZE and sent as JPEG,
+        which is several times smaller than the PNG the SDK makes from a PIL image.
+        Frames that are already JPEG bytes are sent as-is.
+        """
+        if isinstance(frame, bytes):
+            return {"mime_type": "image/jpeg", "data": frame}
+        
         pil_image = Image.fromarray(frame)
+        pil_image.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE), Image.LANCZOS)
         
-        # Create prompt for Gemini
-        prompt = """Analyze the facial expression and body language in this image.
-Respond ONLY with valid JSON in this exact format (no markdown, no extra text):
-{
-  "Happy": 0,
-  "Angry": 0,
-  "Disgust": 0,
-  "Fear": 0,
-  "Surprise": 0,
-  "Sad": 0,
-  "Neutral": 0,
-  "gesture_score": 7.5
-}
-
-Emotion values should sum to approximately 100. The gesture_score (0-10) rates body language, hand gestures, and posture quality for public speaking."""
+        buffer = io.BytesIO()
+        pil_image.save(buffer, "JPEG", quality=JPEG_QUALITY)
+        
+        return {"mime_type": "image/jpeg", "data": buffer.getvalue()}
+    
+    def _cache_key(self, image_part: Dict) -> str:
+        """
+        Cache key for a frame: hash of its encoded bytes plus the prompt version.
+        """
+        digest = hashlib.blake2b(image_part["data"], digest_size=16).hexdigest()
+        
+        return f"{PROMPT_VERSION}:{digest}"
+    
+    def _analyze_batch(self, batch: List[tuple]) -> List[tuple]:
+        """
+        Analyze several frames with one multi-image Gemini request.
+        Falls back to one request per frame if the response doesn't match the batch.
+        
+        Args:
+            batch: List of (index, timestamp_str, image_part, cache_key) tuples
+        
+        Returns: [(emotion_dict, gesture_score), ...] in frame order
+        """
+        if len(batch) == 1:
+            _, timestamp, image_part, cache_key = batch[0]
+            return [self._analyze_frame(image_part, timestamp, cache_key)]
+        
+        contents = [BATCH_PROMPT.format(count=len(batch))]
+        contents.extend(image_part for _, _, image_part, _ in batch)
         
         try:
-            # Generate response
-            response = self.model.generate_content([prompt, pil_image])
-            
-            # Parse response
-            response_text = response.text.strip()
-            
-            # Remove markdown code blocks if present
-            if response_text.startswith("```"):
-                response_text = response_text.split("```")[1]
-                if response_text.startswith("json"):
-                    response_text = response_text[4:].strip()
-            
-            data = json.loads(response_text)
-            
-            # Extract gesture score
-            gesture_score = float(data.get("gesture_score", 5.0))
+            response_text = self._generate_text(contents)
+            data = self._parse_json(response_text)
             
-            # Validate emotions
-            required_emotions = ["Happy", "Angry", "Disgust", "Fear", "Surprise", "Sad", "Neutral"]
-            emotions = {}
-            for emotion in required_emotions:
-                emotions[emotion] = data.get(emotion, 0)
+            results = data["results"]
+            if len(results) != len(batch):
+                raise ValueError(f"expected {len(batch)} results, got {len(results)}")
             
-            # Find dominant emotion
-            dominant = max(emotions, key=emotions.get)
+            parsed = [
+                self._parse_frame_result(result, timestamp)
+                for (_, timestamp, _, _), result in zip(batch, results)
+            ]
+        except Exception as e:
+            print(f"Error analyzing frames {batch[0][1]}-{batch[-1][1]} as a batch, retrying individually: {e}")
+            return [
+                self._analyze_frame(image_part, timestamp, cache_key)
+                for _, timestamp, image_part, cache_key in batch
+            ]
+        
+        for (_, _, _, cache_key), result in zip(batch, parsed):
+            self._cache.set(cache_key, result)
+        
+        return parsed
+    
+    def _analyze_frame(self, image_part: Dict, timestamp: str, cache_key: str) -> tuple:
+        """
+        Analyze emotions and gestures in a single encoded frame using Gemini Vision.
+        Returns: (emotion_dict, gesture_score)
+        """
+        try:
+            # Generate response
+            response_text = self._generate_text([FRAME_PROMPT, image_part])
             
-            # Add metadata
-            emotions["time"] = timestamp
-            emotions["dominant"] = dominant
+            # Parse response
+            data = self._parse_json(response_text)
             
-            return emotions, gesture_score
+            result = self._parse_frame_result(data, timestamp)
             
         except Exception as e:
             print(f"Error analyzing frame at {timestamp}: {e}")
             # Return neutral emotions and average gesture score on error
-            return {
-                "time": timestamp,
-                "Happy": 0,
-                "Angry": 0,
-                "Disgust": 0,
-                "Fear": 0,
-                "Surprise": 0,
-                "Sad": 0,
-                "Neutral": 100,
-                "dominant": "Neutral"
-            }, 5.0
+            return {**NEUTRAL_EMOTIONS, "time": timestamp}, 5.0
+        
+        self._cache.set(cache_key, result)
+        
+        return result
+    
+    def _parse_frame_result(self, data: Dict, timestamp: str) -> tuple:
+        """
+        Turn one frame's parsed Gemini JSON into (emotion_dict, gesture_score).
+        """
+        # Extract gesture score
+        gesture_score = _to_score(data.get("gesture_score"), 5.0)
+        
+        # Validate emotions
+        emotions = {}
+        for emotion in EMOTIONS:
+            emotions[emotion] = _to_score(data.get(emotion, 0))
+        
+        # Find dominant emotion
+        dominant = max(emotions, key=emotions.get)
+        
+        # Add metadata
+        emotions["time"] = timestamp
+        emotions["dominant"] = dominant
+        
+        return emotions, gesture_score
+    
+    def _parse_json(self, response_text: str) -> Dict:
+        """
+        Parse the JSON object in a response, ignoring any surrounding markdown.
+        """
+        match = _JSON_RE.search(response_text)
+        
+        return orjson.loads(match.group(0) if match else response_text)
+    
+    def _generate_text(self, contents: list) -> str:
+        """
+        Call Gemini and return the full response text, backing off exponentially
+        (capped, with jitter) while the API is rate limiting. The response is
+        streamed so chunks are received while the rest is still being generated.
+        """
+        for attempt in range(MAX_RATE_LIMIT_ATTEMPTS):
+            try:
+                response = self.model.generate_content(contents, stream=True)
+                return "".join(chunk.text for chunk in response).strip()
+            except google_exceptions.ResourceExhausted:
+                if attempt == MAX_RATE_LIMIT_ATTEMPTS - 1:
+                    raise
+                # Jitter so the parallel frame batches don't retry in lockstep
+                time.sleep(min(2 ** attempt, 8) + random.random())
     
     def _calculate_overall_rating(self, timeline: List[Dict]) -> float:
         """
@@ -161,24 +420,11 @@ Emotion values should sum to approximately 100. The gesture_score (0-10) rates b
             return 5.0
         
         # Count dominant emotions
-        emotion_counts = {}
-        positive_emotions = ['Happy', 'Surprise']
-        negative_emotions = ['Angry', 'Disgust', 'Fear', 'Sad']
+        emotion_counts = Counter(entry.get('dominant', 'Neutral') for entry in timeline)
         
-        positive_count = 0
-        negative_count = 0
-        neutral_count = 0
-        
-        for entry in timeline:
-            dominant = entry.get('dominant', 'Neutral')
-            emotion_counts[dominant] = emotion_counts.get(dominant, 0) + 1
-            
-            if dominant in positive_emotions:
-                positive_count += 1
-            elif dominant in negative_emotions:
-                negative_count += 1
-            else:
-                neutral_count += 1
+        positive_count = sum(emotion_counts[emotion] for emotion in POSITIVE_EMOTIONS)
+        negative_count = sum(emotion_counts[emotion] for emotion in NEGATIVE_EMOTIONS)
+        neutral_count = len(timeline) - positive_count - negative_count
         
         total = len(timeline)
         
@@ -224,17 +470,10 @@ Emotion values should sum to approximately 100. The gesture_score (0-10) rates b
         """
         Get a text description of gesture quality based on rating.
         """
-        if rating >= 9.0:
-            return "Exceptional and highly engaging"
-        elif rating >= 8.0:
-            return "Very effective and natural"
-        elif rating >= 7.0:
-            return "Natural and purposeful"
-        elif rating >= 6.0:
-            return "Generally appropriate"
-        elif rating >= 5.0:
-            return "Adequate with room for improvement"
-        else:
-            return "Needs significant improvement"
+        for threshold, description in GESTURE_DESCRIPTIONS:
+            if rating >= threshold:
+                return description
+        
+        return "Needs significant improvement"
 
 
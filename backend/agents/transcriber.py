@@ -1,9 +1,75 @@
 """
 Transcriber Agent - Uses faster-whisper for transcription and analyzes speech quality.
 """
-from faster_whisper import WhisperModel
+from faster_whisper import WhisperModel, BatchedInferencePipeline, decode_audio
+import ctranslate2
+import numpy as np
+import asyncio
+import threading
+import os
 import re
-from typing import Dict
+from collections import Counter
+from typing import Dict, Union
+
+
+# Common filler words
+FILLER_WORDS = frozenset({
+    'um', 'uh', 'like', 'you know', 'so', 'basically', 'actually',
+    'literally', 'kind of', 'sort of', 'i mean', 'right', 'okay'
+})
+
+# Single-pass matcher for all fillers; longest first so multi-word
+# fillers win, word boundaries so "so" doesn't match inside "also"
+_FILLER_RE = re.compile(
+    r'\b(?:' + '|'.join(
+        re.escape(filler) for filler in sorted(FILLER_WORDS, key=len, reverse=True)
+    ) + r')\b'
+)
+
+_SENT_SPLIT = re.compile(r'[.!?]+')
+
+# Decoding defaults, overridable per deployment: greedy decoding and no VAD
+# keep short coaching clips fast
+WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "1"))
+WHISPER_VAD = os.getenv("WHISPER_VAD", "0").lower() in ("1", "true", "yes")
+
+# Transcriptions the model runs in parallel
+WHISPER_NUM_WORKERS = 2
+
+# Whisper's sample rate; clips longer than one 30 s window are decoded with
+# the batched pipeline, shorter ones sequentially (batching only adds overhead)
+WHISPER_SR = 16000
+BATCHED_MIN_SECONDS = 30
+
+
+# Loaded models shared by every TranscriberAgent in the process, keyed by
+# (model_size, device, compute_type), so a new agent doesn't reload weights
+_MODEL_CACHE: Dict[tuple, WhisperModel] = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+
+
+def _load_model(model_size: str, device: str, compute_type: str) -> WhisperModel:
+    """
+    Return the cached WhisperModel for this configuration, loading it on first use.
+    """
+    key = (model_size, device, compute_type)
+    
+    with _MODEL_CACHE_LOCK:
+        model = _MODEL_CACHE.get(key)
+        if model is None:
+            # Half the cores (the rest serve librosa and the request threads),
+            # at most 8 since a single decode stops scaling past that; two
+            # workers let concurrent transcriptions share the model
+            model = WhisperModel(
+                model_size,
+                device=device,
+                compute_type=compute_type,
+                cpu_threads=min(8, max(1, (os.cpu_count() or 2) // 2)),
+                num_workers=WHISPER_NUM_WORKERS
+            )
+            _MODEL_CACHE[key] = model
+    
+    return model
 
 
 class TranscriberAgent:
@@ -14,40 +80,120 @@ class TranscriberAgent:
     - Argumentation (logical flow)
     """
     
-    def __init__(self, model_size: str = "base"):
+    def __init__(self, model_size: str = "base", batch_size: int = 16, beam_size: int = WHISPER_BEAM_SIZE):
         """
         Initialize the Whisper model.
         Args:
             model_size: Model size (tiny, base, small, medium, large)
+            batch_size: Speech chunks decoded together for long recordings
+            beam_size: Default beam width; raise it when accuracy matters more than speed
         """
-        # Use CPU for AMD compatibility
-        self.model = WhisperModel(model_size, device="cpu", compute_type="int8")
+        # CUDA only when an NVIDIA GPU is visible, otherwise CPU (AMD GPUs
+        # aren't supported by CTranslate2); WHISPER_DEVICE overrides
+        device = os.getenv("WHISPER_DEVICE") or (
+            "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+        )
         
-        # Common filler words
-        self.filler_words = {
-            'um', 'uh', 'like', 'you know', 'so', 'basically', 'actually',
-            'literally', 'kind of', 'sort of', 'i mean', 'right', 'okay'
-        }
+        # int8 weights everywhere, accumulating in float32 on CPU; on x86
+        # CTranslate2's int8 GEMM dispatches to VNNI dot-product instructions
+        # where the CPU has them
+        compute_type = os.getenv("WHISPER_COMPUTE_TYPE") or (
+            "int8_float16" if device == "cuda" else "int8_float32"
+        )
+        
+        self.model = _load_model(model_size, device, compute_type)
+        
+        # Long recordings are split on VAD speech boundaries and the chunks
+        # decoded as one batch instead of window after window
+        self.batched_model = BatchedInferencePipeline(model=self.model)
+        self.batch_size = batch_size
+        self.beam_size = beam_size
+        
+        # One in-flight transcription per model worker, so async callers queue
+        # here instead of oversubscribing CTranslate2's threads. Created on first
+        # use, since __init__ may run in a worker thread outside the event loop
+        self._slots = None
+        
+        self.filler_words = FILLER_WORDS
     
-    def transcribe(self, audio_path: str) -> Dict:
+    def warmup(self):
+        """
+        Push one second of silence through the model so CTranslate2's thread
+        pool and kernels are initialized before the first request.
+        """
+        try:
+            # VAD would drop the silence before it reaches the model
+            segments, _ = self.model.transcribe(
+                np.zeros(WHISPER_SR, dtype=np.float32),
+                beam_size=1,
+                vad_filter=False
+            )
+            list(segments)
+        except Exception as e:
+            print(f"Warning: Whisper warmup failed: {e}")
+    
+    async def transcribe_async(self, audio: Union[str, np.ndarray], **kwargs) -> Dict:
+        """
+        Async wrapper for transcribe: runs in a worker thread so the event loop
+        stays responsive, bounded to the model's worker count.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(WHISPER_NUM_WORKERS)
+        
+        async with self._slots:
+            return await asyncio.to_thread(self.transcribe, audio, **kwargs)
+    
+    def transcribe(
+        self,
+        audio: Union[str, np.ndarray],
+        beam_size: int = None,
+        vad_filter: bool = WHISPER_VAD,
+        condition_on_previous_text: bool = False
+    ) -> Dict:
         """
         Transcribe audio and analyze quality.
         
+        Args:
+            audio: Path to an audio file, or mono float32 samples at 16 kHz
+            beam_size: Overrides the agent's beam width; 1 (greedy) is several
+                times faster than beam search on CPU
+            vad_filter: Skip silent stretches with Silero VAD (worth it on long recordings)
+            condition_on_previous_text: Feed each segment's text into the next decode
+        
         Returns:
             {
                 "text": str,
                 "quality_score": float (0-10)
             }
         """
-        # Transcribe
-        segments, info = self.model.transcribe(audio_path, beam_size=5)
+        if beam_size is None:
+            beam_size = self.beam_size
         
-        # Collect all text
-        full_text = ""
-        for segment in segments:
-            full_text += segment.text + " "
+        # Decode up front so the clip length can pick the pipeline
+        if isinstance(audio, str):
+            audio = decode_audio(audio, sampling_rate=WHISPER_SR)
         
-        full_text = full_text.strip()
+        if len(audio) > BATCHED_MIN_SECONDS * WHISPER_SR:
+            # The batched pipeline chunks by VAD, so it's always on here
+            segments, info = self.batched_model.transcribe(
+                audio,
+                beam_size=beam_size,
+                batch_size=self.batch_size,
+                vad_filter=True,
+                vad_parameters=dict(min_silence_duration_ms=500)
+            )
+        else:
+            segments, info = self.model.transcribe(
+                audio,
+                beam_size=beam_size,
+                best_of=1,
+                vad_filter=vad_filter,
+                vad_parameters=dict(min_silence_duration_ms=500),
+                condition_on_previous_text=condition_on_previous_text
+            )
+        
+        # Collect all text (segments is a generator; decoding happens here)
+        full_text = " ".join(text for text in (segment.text.strip() for segment in segments) if text)
         
         if not full_text:
             return {
@@ -75,15 +221,13 @@ class TranscriberAgent:
             return 3.0  # Too short
         
         # Factor 1: Clarity (filler word ratio)
-        filler_count = 0
-        for filler in self.filler_words:
-            filler_count += text_lower.count(filler)
+        filler_count = len(_FILLER_RE.findall(text_lower))
         
         filler_ratio = filler_count / len(words)
         clarity_score = max(0, 10 - (filler_ratio * 50))  # Penalize fillers
         
         # Factor 2: Content structure (sentence count and variety)
-        sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
+        sentences = [s.strip() for s in _SENT_SPLIT.split(text) if s.strip()]
         sentence_count = len(sentences)
         
         if sentence_count == 0:
@@ -98,22 +242,18 @@ class TranscriberAgent:
             else:
                 structure_score = 6.0
         
+        # One counting pass feeds both vocabulary richness and repetition
+        word_counts = Counter(words)
+        
         # Factor 3: Vocabulary richness (unique words ratio)
-        unique_words = set(words)
-        vocab_ratio = len(unique_words) / len(words)
+        vocab_ratio = len(word_counts) / len(words)
         vocab_score = min(10, vocab_ratio * 20)  # Higher ratio = richer vocabulary
         
         # Factor 4: Coherence (check for repeated phrases - indicates planning)
-        # Penalize excessive repetition
-        word_counts = {}
-        for word in words:
-            if len(word) > 4:  # Only count meaningful words
-                word_counts[word] = word_counts.get(word, 0) + 1
-        
-        repetition_penalty = 0
-        for count in word_counts.values():
-            if count > 5:  # Word repeated more than 5 times
-                repetition_penalty += 0.5
+        # Penalize meaningful words (> 4 chars) repeated more than 5 times
+        repetition_penalty = 0.5 * sum(
+            1 for word, count in word_counts.items() if count > 5 and len(word) > 4
+        )
         
         coherence_score = max(0, 10 - repetition_penalty)
         
@@ -2,7 +2,17 @@
 Main FastAPI application for Aesop AI backend.
 """
 import os
+
+# Cap OpenMP/BLAS pools (numpy, librosa, CTranslate2) at half the cores so they
+# don't oversubscribe the CPU while Whisper, librosa and OpenCV run side by
+# side; has to be set before any of them is imported
+os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 2) // 2)))
+
+import asyncio
 import tempfile
+import uuid
+import hashlib
+import aiofiles
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -10,16 +20,13 @@ from typing import Dict, Any, List
 import json
 from dotenv import load_dotenv
 
-# Import agents
-from agents.transcriber import TranscriberAgent
-from agents.voice_analyzer import VoiceAnalyzerAgent
-from agents.emotion_analyzer import EmotionAnalyzerAgent
-from agents.action_agent import ActionAgent
+# Import agents (each agent's module loads when its getter first runs)
+import agents
 
 # Import utilities
 from utils.video_utils import (
     extract_audio_from_video,
-    extract_frames_at_interval,
+    extract_jpeg_frames_at_interval,
     cleanup_temp_file
 )
 
@@ -44,26 +51,48 @@ voice_agent = None
 emotion_agent = None
 action_agent = None
 
+# Caps how many videos have their emotions analyzed at once (each analysis fans
+# its frames out over the analyzer's own thread pool); created on first use so
+# it binds to the server's running event loop
+emotion_analysis_semaphore = None
+
+# Analyses currently running, keyed by SHA-256 of the uploaded video, so duplicate
+# uploads (client retries, double clicks) share one computation
+inflight_analyses: Dict[str, asyncio.Task] = {}
+
+# Uploads are streamed to disk in chunks of this size instead of read whole
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 def get_transcriber():
     global transcriber_agent
     if transcriber_agent is None:
-        transcriber_agent = TranscriberAgent(model_size="base")
+        transcriber_agent = agents.TranscriberAgent(model_size="base")
     return transcriber_agent
 
 
 def get_voice_analyzer():
     global voice_agent
     if voice_agent is None:
-        voice_agent = VoiceAnalyzerAgent()
+        voice_agent = agents.VoiceAnalyzerAgent()
     return voice_agent
 
 
+def get_emotion_analysis_semaphore():
+    global emotion_analysis_semaphore
+    if emotion_analysis_semaphore is None:
+        limit = int(os.getenv("EMOTION_MAX_CONCURRENT_ANALYSES", "5"))
+        emotion_analysis_semaphore = asyncio.Semaphore(limit)
+    return emotion_analysis_semaphore
+
+
 def get_emotion_analyzer():
     global emotion_agent
     if emotion_agent is None:
         api_key = os.getenv("GEMINI_API_KEY")
-        emotion_agent = EmotionAnalyzerAgent(api_key=api_key)
+        # EMOTION_KEYFRAME_STRIDE=k sends every k-th frame to Gemini and interpolates the rest
+        keyframe_stride = int(os.getenv("EMOTION_KEYFRAME_STRIDE", "1"))
+        emotion_agent = agents.EmotionAnalyzerAgent(api_key=api_key, keyframe_stride=keyframe_stride)
     return emotion_agent
 
 
@@ -71,7 +100,17 @@ def get_action_agent():
     global action_agent
     if action_agent is None:
         api_key = os.getenv("GEMINI_API_KEY")
-        action_agent = ActionAgent(api_key=api_key)
+        # ADVICE_BATCH_SIZE > 1 coalesces concurrent users' prompts into shared Gemini calls
+        batch_size = int(os.getenv("ADVICE_BATCH_SIZE", "1"))
+        # ADVICE_HEDGE=1 races the primary and fallback models for lower tail latency
+        hedge = os.getenv("ADVICE_HEDGE", "0") == "1"
+        if batch_size > 1:
+            if hedge:
+                print("Warning: ADVICE_HEDGE is not supported with ADVICE_BATCH_SIZE > 1; "
+                      "batched advice requests will not be hedged")
+            action_agent = agents.BatchingActionAgent(api_key=api_key, max_batch_size=batch_size)
+        else:
+            action_agent = agents.ActionAgent(api_key=api_key, hedge=hedge)
     return action_agent
 
 
@@ -81,6 +120,30 @@ class ActionableAdviceRequest(BaseModel):
     context: str = ""
 
 
+@app.on_event("startup")
+async def warm_up_agents():
+    """
+    Build every agent and pay one-time import/JIT costs before serving the
+    first request, so no user waits on model loading.
+    """
+    print("Warming up agents...")
+    getters = (get_transcriber, get_voice_analyzer, get_emotion_analyzer, get_action_agent)
+    
+    # Constructed in threads so model loads overlap and don't block the event loop
+    results = await asyncio.gather(
+        *(asyncio.to_thread(getter) for getter in getters),
+        return_exceptions=True
+    )
+    for getter, result in zip(getters, results):
+        if isinstance(result, Exception):
+            # Leave it to be retried lazily on first use (e.g. missing API key)
+            print(f"Warning: {getter.__name__} failed during warmup: {result}")
+    
+    warmups = [agent.warmup for agent in (transcriber_agent, voice_agent) if agent is not None]
+    await asyncio.gather(*(asyncio.to_thread(warmup) for warmup in warmups))
+    print("Agents ready")
+
+
 @app.get("/")
 def read_root():
     return {
@@ -99,50 +162,98 @@ async def analyze_speech(
     Analyze uploaded video for speech quality.
     Returns transcription, voice analysis, and emotion analysis.
     """
-    temp_video_path = None
+    # Stream the upload to a temp file (unique per request so concurrent uploads
+    # don't collide), hashing as we go so memory stays flat for large videos
+    request_id = uuid.uuid4().hex
+    temp_video_path = os.path.join(tempfile.gettempdir(), f"video_{request_id}.webm")
+    hasher = hashlib.sha256()
+    size = 0
+    
+    try:
+        async with aiofiles.open(temp_video_path, "wb") as f:
+            while chunk := await video.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                size += len(chunk)
+                await f.write(chunk)
+    except Exception:
+        cleanup_temp_file(temp_video_path)
+        raise
+    
+    if not size:
+        cleanup_temp_file(temp_video_path)
+        raise HTTPException(status_code=400, detail="Uploaded video is empty")
+    
+    print(f"Video saved to: {temp_video_path}")
+    video_hash = hasher.hexdigest()
+    
+    task = inflight_analyses.get(video_hash)
+    if task is not None:
+        print("Identical video is already being analyzed, sharing its result")
+        cleanup_temp_file(temp_video_path)
+        return await asyncio.shield(task)
+    
+    task = asyncio.ensure_future(run_analysis(temp_video_path, request_id))
+    inflight_analyses[video_hash] = task
+    
+    # Forget the run only once it finishes, not when its first awaiter goes away,
+    # so later duplicates still join it even if that client disconnected
+    def forget_analysis(done: asyncio.Task):
+        if inflight_analyses.get(video_hash) is done:
+            del inflight_analyses[video_hash]
+    
+    task.add_done_callback(forget_analysis)
+    
+    # Shielded so one client disconnecting doesn't cancel the run others await
+    return await asyncio.shield(task)
+
+
+async def run_analysis(temp_video_path: str, request_id: str) -> Dict[str, Any]:
+    """
+    Run the full analysis pipeline on an uploaded video saved to disk.
+    The video file is removed when the analysis finishes.
+    """
     temp_audio_path = None
     
     try:
-        # Save uploaded video to temp file
-        temp_video_path = os.path.join(tempfile.gettempdir(), f"video_{os.getpid()}.webm")
-        with open(temp_video_path, "wb") as f:
-            content = await video.read()
-            f.write(content)
+        # Extract audio and JPEG frames (every 5 seconds) with two concurrent ffmpeg processes
+        print("Extracting audio and frames...")
+        temp_audio_path = os.path.join(tempfile.gettempdir(), f"audio_{request_id}.wav")
+        _, frames = await asyncio.gather(
+            asyncio.to_thread(extract_audio_from_video, temp_video_path, temp_audio_path),
+            asyncio.to_thread(extract_jpeg_frames_at_interval, temp_video_path, 5.0)
+        )
+        print(f"Audio extracted to: {temp_audio_path}")
+        print(f"Extracted {len(frames)} frames")
         
-        print(f"Video saved to: {temp_video_path}")
+        # Run Data Agents in parallel: they read disjoint inputs (audio vs. frames)
+        # and spend most of their time in native code or network I/O.
+        print("Running transcription, voice analysis and emotion analysis...")
+        transcriber = get_transcriber()
+        voice_analyzer = get_voice_analyzer()
+        emotion_analyzer = get_emotion_analyzer()
         
-        # Extract audio from video
-        print("Extracting audio...")
-        temp_audio_path = extract_audio_from_video(temp_video_path)
-        print(f"Audio extracted to: {temp_audio_path}")
+        # Decode the extracted audio once: Whisper and the voice analyzer both
+        # work on 16 kHz mono float32 samples
+        audio, sr = await asyncio.to_thread(voice_analyzer.load_audio, temp_audio_path)
+        transcription_input = audio if sr == 16000 else temp_audio_path
         
-        # Extract frames from video (every 5 seconds)
-        print("Extracting frames...")
-        frames = extract_frames_at_interval(temp_video_path, interval_seconds=5.0)
-        print(f"Extracted {len(frames)} frames")
+        async def run_emotion_analysis():
+            async with get_emotion_analysis_semaphore():
+                return await asyncio.to_thread(emotion_analyzer.analyze, frames)
         
-        # Run Data Agents in parallel (or sequentially for simplicity)
-        results = {}
+        transcription_result, voice_result, emotion_result = await asyncio.gather(
+            transcriber.transcribe_async(transcription_input),
+            asyncio.to_thread(voice_analyzer.analyze_signal, audio, sr),
+            run_emotion_analysis()
+        )
         
-        # 1. Transcriber Agent
-        print("Running transcription...")
-        transcriber = get_transcriber()
-        transcription_result = transcriber.transcribe(temp_audio_path)
-        results['transcription'] = transcription_result
+        results = {
+            'transcription': transcription_result,
+            'voice': voice_result,
+            'emotions': emotion_result
+        }
         print(f"Transcription complete: {transcription_result['quality_score']}/10")
-        
-        # 2. Voice Analyzer Agent
-        print("Running voice analysis...")
-        voice_analyzer = get_voice_analyzer()
-        voice_result = voice_analyzer.analyze(temp_audio_path)
-        results['voice'] = voice_result
         print(f"Voice analysis complete")
-        
-        # 3. Emotion Analyzer Agent
-        print("Running emotion analysis...")
-        emotion_analyzer = get_emotion_analyzer()
-        emotion_result = emotion_analyzer.analyze(frames)
-        results['emotions'] = emotion_result
         print(f"Emotion analysis complete: {emotion_result['overall_rating']}/10")
         
         return results
@@ -153,8 +264,7 @@ async def analyze_speech(
         
     finally:
         # Cleanup temp files
-        if temp_video_path:
-            cleanup_temp_file(temp_video_path)
+        cleanup_temp_file(temp_video_path)
         if temp_audio_path:
             cleanup_temp_file(temp_audio_path)
 
@@ -167,7 +277,7 @@ async def get_actionable_advice(request: ActionableAdviceRequest):
     try:
         action_agent = get_action_agent()
         
-        advice = action_agent.generate_advice(
+        advice = await action_agent.generate_advice_async(
             agent_type=request.agent_type,
             analysis_data=request.analysis_data,
             context=request.context
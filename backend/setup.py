@@ -2,6 +2,7 @@
 Setup script for Aesop AI Backend
 """
 import os
+import shutil
 import sys
 
 
@@ -34,9 +35,8 @@ def setup():
     
     # Check for ffmpeg
     print("\nChecking for ffmpeg...")
-    result = os.system("ffmpeg -version > /dev/null 2>&1")
-    
-    if result == 0:
+    # A PATH lookup is enough to detect ffmpeg; no need to launch it
+    if shutil.which("ffmpeg"):
         print("✅ ffmpeg is installed!")
     else:
         print("⚠️  ffmpeg not found!")
@@ -0,0 +1,33 @@
+"""
+Check that Gemini's JSON answers parse with and without a wrapping code fence.
+"""
+import json
+
+from agents.action_agent import ActionAgent
+
+
+def make_agent():
+    # Skip __init__: no Gemini client is needed to parse responses
+    return ActionAgent.__new__(ActionAgent)
+
+
+def test_fenced_block_inside_json_string():
+    agent = make_agent()
+    payload = {"advice": "Warm up:\n```\nhum\n```", "breakdown": {"overall_impact": "Good"}}
+    
+    assert agent._parse_json_response(json.dumps(payload)) == payload
+    assert agent._parse_json_response("```json\n" + json.dumps(payload) + "\n```") == payload
+
+
+def test_wrapping_fence_is_stripped():
+    agent = make_agent()
+    
+    assert agent._parse_json_response('```json\n{"advice": "Slow down"}\n```') == {"advice": "Slow down"}
+    assert agent._parse_json_response('```\n["a", "b"]') == ["a", "b"]
+    assert agent._strip_code_fence('["```\\nhum\\n```"]') == '["```\\nhum\\n```"]'
+
+
+if __name__ == "__main__":
+    test_fenced_block_inside_json_string()
+    test_wrapping_fence_is_stripped()
+    print("✅ JSON response parsing OK")
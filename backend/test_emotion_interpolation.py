@@ -0,0 +1,50 @@
+"""
+Check that keyframe_stride > 1 analyzes only keyframes and interpolates the rest.
+"""
+from agents.emotion_analyzer import EmotionAnalyzerAgent, EMOTIONS
+
+
+def make_agent(keyframe_stride):
+    # Skip __init__: no Gemini client or disk cache is needed here
+    agent = EmotionAnalyzerAgent.__new__(EmotionAnalyzerAgent)
+    agent.keyframe_stride = keyframe_stride
+    return agent
+
+
+def test_keyframe_stride_interpolates():
+    agent = make_agent(keyframe_stride=2)
+    analyzed = []
+    
+    def fake_analyze_frames(frames):
+        analyzed.extend(timestamp for timestamp, _ in frames)
+        results = []
+        for timestamp, _ in frames:
+            happy = 100 if timestamp == "00:00" else 0
+            # Non-numeric and missing scores (e.g. from an older cache entry) count as 0
+            emotions = {"Happy": happy, "Sad": "n/a", "Neutral": 100 - happy, "dominant": "Happy"}
+            results.append((emotions, 8.0 if timestamp == "00:00" else 6.0))
+        return results
+    
+    agent._analyze_frames = fake_analyze_frames
+    frames = [(f"00:0{i}", b"") for i in range(4)]
+    
+    result = agent.analyze(frames)
+    timeline = result["timeline"]
+    
+    # Every other frame plus the last one
+    assert analyzed == ["00:00", "00:02", "00:03"]
+    assert [entry["time"] for entry in timeline] == ["00:00", "00:01", "00:02", "00:03"]
+    
+    middle = timeline[1]
+    assert set(EMOTIONS) <= set(middle)
+    assert middle["Happy"] == 50.0
+    assert middle["Neutral"] == 50.0
+    assert middle["Sad"] == 0.0
+    assert middle["Fear"] == 0.0
+    assert middle["dominant"] in ("Happy", "Neutral")
+    assert result["gesture_rating"] == (8.0 + 7.0 + 6.0 + 6.0) / 4
+
+
+if __name__ == "__main__":
+    test_keyframe_stride_interpolates()
+    print("✅ keyframe interpolation OK")
@@ -2,6 +2,7 @@
 Utilities for extracting audio and frames from video files.
 """
 import os
+import subprocess
 import tempfile
 import cv2
 import numpy as np
@@ -28,9 +29,10 @@ def extract_audio_from_video(video_path: str, output_audio_path: str = None) ->
     return output_audio_path
 
 
-def extract_frames_at_interval(video_path: str, interval_seconds: float = 5.0) -> list:
+def extract_frames_at_interval(video_path: str, interval_seconds: float = 5.0, max_size: int = 512) -> list:
     """
     Extract frames from video at specified intervals.
+    Frames larger than max_size on their longest side are downscaled.
     Returns list of tuples: [(timestamp_string, frame_image), ...]
     """
     cap = cv2.VideoCapture(video_path)
@@ -42,23 +44,38 @@ def extract_frames_at_interval(video_path: str, interval_seconds: float = 5.0) -
     if fps == 0:
         fps = 30  # Default fallback
     
-    frame_interval = int(fps * interval_seconds)
+    frame_interval = max(1, int(fps * interval_seconds))
     frames = []
     frame_count = 0
     
     while True:
-        ret, frame = cap.read()
-        
-        if not ret:
+        # grab() only demuxes/decodes; the costly retrieve (copy + colour
+        # conversion into a numpy array) is done just for sampled frames
+        if not cap.grab():
             break
         
         # Extract frame at intervals
         if frame_count % frame_interval == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            
             timestamp_seconds = frame_count / fps
             minutes = int(timestamp_seconds // 60)
             seconds = int(timestamp_seconds % 60)
             timestamp_str = f"{minutes}:{seconds:02d}"
             
+            # Downscale first so the colour conversion (and every later
+            # consumer) touches fewer bytes
+            height, width = frame.shape[:2]
+            scale = max_size / max(height, width)
+            if scale < 1:
+                frame = cv2.resize(
+                    frame,
+                    (int(width * scale), int(height * scale)),
+                    interpolation=cv2.INTER_AREA
+                )
+            
             # Convert BGR to RGB for processing
             frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             frames.append((timestamp_str, frame_rgb))
@@ -70,6 +87,42 @@ def extract_frames_at_interval(video_path: str, interval_seconds: float = 5.0) -
     return frames
 
 
+def extract_jpeg_frames_at_interval(video_path: str, interval_seconds: float = 5.0, max_size: int = 512) -> list:
+    """
+    Extract frames from video at specified intervals as JPEG bytes, sampled,
+    downscaled and encoded by a single ffmpeg process (no numpy round trip).
+    Frames larger than max_size on their longest side are downscaled.
+    Returns list of tuples: [(timestamp_string, jpeg_bytes), ...]
+    """
+    video_filter = (
+        f"fps=1/{interval_seconds},"
+        f"scale='min(iw,{max_size})':'min(ih,{max_size})':force_original_aspect_ratio=decrease"
+    )
+    cmd = [
+        "ffmpeg", "-i", video_path,
+        "-vf", video_filter,
+        "-f", "image2pipe", "-vcodec", "mjpeg", "-q:v", "3",
+        "-loglevel", "error", "pipe:1"
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    if result.returncode != 0:
+        raise ValueError(f"Failed to extract frames from video: {video_path}: {result.stderr.decode(errors='replace')}")
+    
+    # The pipe is back-to-back JPEGs; the end-of-image marker can't occur
+    # inside entropy-coded data, so it delimits frames
+    frames = []
+    for i, chunk in enumerate(result.stdout.split(b"\xff\xd9")[:-1]):
+        timestamp_seconds = i * interval_seconds
+        minutes = int(timestamp_seconds // 60)
+        seconds = int(timestamp_seconds % 60)
+        timestamp_str = f"{minutes}:{seconds:02d}"
+        
+        frames.append((timestamp_str, chunk + b"\xff\xd9"))
+    
+    return frames
+
+
 def save_frame_to_temp(frame: np.ndarray, prefix: str = "frame") -> str:
     """
     Save a frame to a temporary file and return the path.